@@ -1,11 +1,66 @@
 import asyncio
-from functools import partial, wraps
-import inspect
+from functools import wraps
+from inspect import iscoroutine
 
 if not hasattr(asyncio, 'create_task'):  # pragma: no cover
     asyncio.create_task = asyncio.ensure_future
 
 
+_FULFILLED = 'fulfilled'
+_REJECTED = 'rejected'
+_CANCELLED = 'cancelled'
+
+
+def _get_loop():
+    return asyncio._get_running_loop() or asyncio.get_event_loop()
+
+
+def _get_current_loop():
+    # the loop that was set as current for this thread, if any, without
+    # creating one as asyncio.get_event_loop() does
+    get_policy = getattr(asyncio.events, '_get_event_loop_policy',
+                         asyncio.get_event_loop_policy)
+    return getattr(getattr(get_policy(), '_local', None), '_loop', None)
+
+
+# promises with handlers that became ready to run while no loop was running,
+# which wait for the next promise that is awaited to schedule them
+_deferred = []
+
+
+def _dispatch_deferred(loop):
+    promises = _deferred[:]
+    del _deferred[:]
+    for promise in promises:
+        promise._loop = loop
+        loop.call_soon(promise._dispatch)
+
+
+class _RejectionReporter:
+    # reports the rejection of a promise that was never handled when it is
+    # collected, in the same way asyncio reports futures with exceptions that
+    # were never retrieved; only rejected promises create one of these, so
+    # that other promises do not need a finalizer
+    __slots__ = ('loop', 'error')
+
+    def __init__(self, loop, error):
+        self.loop = loop
+        self.error = error
+
+    def __del__(self):
+        if self.error is None:
+            return
+        context = {
+            'message': 'Promise rejection was never handled',
+            'exception': self.error,
+        }
+        if self.loop is not None:
+            self.loop.call_exception_handler(context)
+        else:
+            asyncio.log.logger.error(context['message'],
+                                     exc_info=self.error)
+
+
 class AggregateError(RuntimeError):
     """An exception that holds a list of errors.
 
@@ -29,8 +84,11 @@ class Promise:
     Note: Creating a promise object directly is often unnecessary. The
     :func:`promisify` decorator is a much more convenient option.
     """
+    __slots__ = ('_state', '_value', '_traceback', '_reporter', '_handlers',
+                 '_loop', '_future', '__weakref__')
+
     def __init__(self, f=None):
-        self.future = asyncio.Future()
+        self._init()
         if f:
             f(self._resolve, self._reject)
 
@@ -44,9 +102,20 @@ class Promise:
         handler, or to the original settled value if a handler was not
         provided.
         """
-        promise = Promise()
-        self.future.add_done_callback(
-            partial(self._handle_done, on_resolved, on_rejected, promise))
+        promise = Promise._new_pending()
+        if self._state is not None:
+            self._clear_reporter()
+            # without a handler for the outcome there is nothing to wait for,
+            # so the new promise can be settled right away
+            if self._state is _FULFILLED:
+                if not callable(on_resolved):
+                    promise._resolve(self._value)
+                    return promise
+            elif not callable(on_rejected):
+                promise._reject(self._value)
+                return promise
+
+        self._add_handler(on_resolved, on_rejected, promise)
         return promise
 
     def catch(self, on_rejected):
@@ -77,36 +146,47 @@ class Promise:
 
         A promise that is cancelled rejects with a ``asyncio.CancelledError``.
         """
-        return self.future.cancel()
+        if self._state is not None:
+            return False
+        self._settle(_CANCELLED, asyncio.CancelledError())
+        return True
 
     def cancelled(self):
         """Checks if a promise has been cancelled."""
-        return self.future.cancelled()
+        return self._state is _CANCELLED
+
+    @property
+    def future(self):
+        # an asyncio future that mirrors the state of the promise, created
+        # only if requested
+        if self._future is None:
+            self._future = _get_loop().create_future()
+            self._future.add_done_callback(self._handle_future_done)
+            if self._state is not None:
+                # the future reports its exception if it is never retrieved
+                self._clear_reporter()
+                self._update_future()
+        return self._future
 
     @staticmethod
     def resolve(value):
-        """Returns a new Promise object that resolves to the given value.
+        """Returns a Promise object that resolves to the given value.
 
         :param value: the value the promise will resolve to.
 
-        If the value is another ``Promise`` instance, the new promise will
-        resolve or reject when this promise does. If the value is an asyncio
-        ``Task`` object, the new promise will be associated with the task and
-        will pass cancellation requests to it if its :func:`Promise.cancel`
-        method is invoked. Any other value creates a promise that immediately
-        resolves to the value.
+        If the value is another ``Promise`` instance, that same promise is
+        returned. If the value is an asyncio ``Task`` object, the new promise
+        will be associated with the task and will pass cancellation requests
+        to it if its :func:`Promise.cancel` method is invoked. Any other value
+        creates a promise that immediately resolves to the value.
         """
         promise = None
         if isinstance(value, Promise):
-            promise = Promise()
-            value.then(lambda res: promise._resolve(res),
-                       lambda err: promise._reject(err))
+            promise = value
         elif isinstance(value, asyncio.Task):
             promise = TaskPromise(value)
-            value.add_done_callback(
-                partial(Promise._handle_done, None, None, promise))
         else:
-            promise = Promise()
+            promise = Promise._new_pending()
             promise._resolve(value)
         return promise
 
@@ -116,7 +196,7 @@ class Promise:
 
         :param reason: the rejection reason. Must be an ``Exception`` instance.
         """
-        promise = Promise()
+        promise = Promise._new_pending()
         promise._reject(reason)
         return promise
 
@@ -124,34 +204,54 @@ class Promise:
     def all(promises):
         """Wait for all promises to be resolved, or for any to be rejected.
 
-        :param promises: a list of promises to wait for.
+        :param promises: a list or other iterable of promises to wait for.
 
         Returns a promise that resolves to a aggregating list of all the values
         from the resolved input promises, in the same order as given. If one or
         more of the input promises are rejected, the returned promise is
         rejected with the reason of the first rejected promise.
         """
-        new_promise = Promise()
+        new_promise = Promise._new_pending()
         results = []
-        total = len(promises)
+        total = 0
         resolved = 0
+        input_closed = False
 
         def _resolve(index, result):
-            nonlocal results, resolved
+            nonlocal resolved
 
-            if len(results) < index + 1:
-                results += [None] * (index + 1 - len(results))
             results[index] = result
             resolved += 1
-            if resolved == total:
+            if input_closed and resolved == total:
                 new_promise._resolve(results)
 
-        index = 0
-        for promise in promises:
-            Promise.resolve(promise).then(partial(_resolve, index),
-                                          new_promise._reject)
-            index += 1
-
+        # local names avoid attribute lookups inside the loop
+        promise_types = (Promise, asyncio.Task)
+        resolve = Promise.resolve
+        reject_once = new_promise._reject_once
+        append = results.append
+        for index, promise in enumerate(promises):
+            total += 1
+            append(None)
+            if not isinstance(promise, promise_types):
+                # plain values do not need to go through the event loop
+                results[index] = promise
+                resolved += 1
+            elif isinstance(promise, Promise) and promise._state is not None:
+                if promise._state is not _FULFILLED:
+                    # the remaining inputs are still observed, so that their
+                    # rejections are not reported as unhandled
+                    promise._clear_reporter()
+                    reject_once(promise._value)
+                else:
+                    results[index] = promise._value
+                    resolved += 1
+            else:
+                resolve(promise).then(
+                    lambda result, index=index: _resolve(index, result),
+                    reject_once)
+
+        input_closed = True
         if total == resolved:
             new_promise._resolve(results)
         return new_promise
@@ -160,7 +260,7 @@ class Promise:
     def all_settled(promises):
         """Wait until all promises are resolved or rejected.
 
-        :param promises: a list of promises to wait for.
+        :param promises: a list or other iterable of promises to wait for.
 
         Returns a promise that resolves to a list of dicts, where each dict
         describes the outcome of each promise. For a promise that was
@@ -172,43 +272,104 @@ class Promise:
 
             {'status': 'rejected', 'reason': <rejected-reason>}
         """
-        return Promise.all([promise.then(
-            lambda value: {'status': 'fulfilled', 'value': value}).catch(
-                lambda reason: {'status': 'rejected', 'reason': reason})
-            for promise in promises])
+        new_promise = Promise._new_pending()
+        results = []
+        total = 0
+        settled = 0
+        input_closed = False
+
+        def _settle(index, result):
+            nonlocal settled
+
+            results[index] = result
+            settled += 1
+            if input_closed and settled == total:
+                new_promise._resolve(results)
+
+        # local names avoid attribute lookups inside the loop
+        promise_types = (Promise, asyncio.Task)
+        resolve = Promise.resolve
+        append = results.append
+        for index, promise in enumerate(promises):
+            total += 1
+            if not isinstance(promise, promise_types):
+                # plain values do not need to go through the event loop
+                append({'status': 'fulfilled', 'value': promise})
+                settled += 1
+            elif isinstance(promise, Promise) and promise._state is not None:
+                if promise._state is _FULFILLED:
+                    append({'status': 'fulfilled', 'value': promise._value})
+                else:
+                    promise._clear_reporter()
+                    append({'status': 'rejected', 'reason': promise._value})
+                settled += 1
+            else:
+                # observe the promise directly, instead of chaining two
+                # additional promises to it
+                append(None)
+                resolve(promise)._add_handler(
+                    lambda value, index=index: _settle(
+                        index, {'status': 'fulfilled', 'value': value}),
+                    lambda reason, index=index: _settle(
+                        index, {'status': 'rejected', 'reason': reason}),
+                    None)
+
+        input_closed = True
+        if total == settled:
+            new_promise._resolve(results)
+        return new_promise
 
     @staticmethod
     def any(promises):
         """Wait until any of the promises given resolves.
 
-        :oaram promises: a list of promises to wait for.
+        :param promises: a list or other iterable of promises to wait for.
 
         Returns a promise that resolves with the value of the first input
         promise. Promise rejections are ignored, except when all the input
         promises are rejected, in which case the returned promise rejects with
         an :class:`AggregateError`.
         """
-        new_promise = Promise()
+        new_promise = Promise._new_pending()
         errors = []
-        total = len(promises)
+        total = 0
         rejected = 0
+        input_closed = False
 
         def _reject(index, error):
-            nonlocal errors, rejected
+            nonlocal rejected
 
-            if len(errors) < index + 1:
-                errors += [None] * (index + 1 - len(errors))
             errors[index] = error
             rejected += 1
-            if rejected == total:
+            if input_closed and rejected == total:
                 new_promise._reject(AggregateError(errors))
 
-        index = 0
-        for promise in promises:
-            Promise.resolve(promise).then(new_promise._resolve,
-                                          partial(_reject, index))
-            index += 1
-
+        # local names avoid attribute lookups inside the loop
+        promise_types = (Promise, asyncio.Task)
+        resolve = Promise.resolve
+        resolve_once = new_promise._resolve_once
+        append = errors.append
+        for index, promise in enumerate(promises):
+            total += 1
+            append(None)
+            if not isinstance(promise, promise_types):
+                # plain values do not need to go through the event loop
+                resolve_once(promise)
+            elif isinstance(promise, Promise) and promise._state is not None:
+                # the remaining inputs are still observed, so that their
+                # rejections are not reported as unhandled
+                if promise._state is _FULFILLED:
+                    resolve_once(promise._value)
+                else:
+                    promise._clear_reporter()
+                    errors[index] = promise._value
+                    rejected += 1
+            else:
+                resolve(promise).then(
+                    resolve_once,
+                    lambda error, index=index: _reject(index, error))
+
+        input_closed = True
         if total == rejected:
             new_promise._reject(AggregateError(errors))
         return new_promise
@@ -222,41 +383,127 @@ class Promise:
         Returns a promise that resolves or rejects with the first input
         promise that settles.
         """
-        new_promise = Promise()
-        settled = False
-
-        def _resolve(result):
-            nonlocal settled
-
-            if not settled:
-                settled = True
-                new_promise._resolve(result)
-
-        def _reject(error):
-            nonlocal settled
-
-            if not settled:
-                settled = True
-                new_promise._reject(error)
-
+        new_promise = Promise._new_pending()
+        resolve = Promise.resolve
+        resolve_once = new_promise._resolve_once
+        reject_once = new_promise._reject_once
         for promise in promises:
-            Promise.resolve(promise).then(_resolve, _reject)
+            resolve(promise).then(resolve_once, reject_once)
         return new_promise
 
+    @classmethod
+    def _new_pending(cls):
+        # create a pending promise, skipping the constructor
+        promise = cls.__new__(cls)
+        promise._init()
+        return promise
+
+    def _init(self):
+        # initialize all the slots of a pending promise
+        self._state = self._value = self._traceback = self._reporter = None
+        self._handlers = self._loop = self._future = None
+
     def _resolve(self, result):
-        self.future.set_result(result)
+        if self._state is not _CANCELLED:
+            self._settle(_FULFILLED, result)
 
     def _reject(self, error):
-        self.future.set_exception(error)
+        if self._state is not _CANCELLED:
+            self._settle(_REJECTED, error)
+
+    def _resolve_once(self, result):
+        # settle the promise only if it has not been settled already
+        if self._state is None:
+            self._settle(_FULFILLED, result)
+
+    def _reject_once(self, error):
+        if self._state is None:
+            self._settle(_REJECTED, error)
+
+    def _settle(self, state, value, schedule=True):
+        if self._state is not None:
+            raise asyncio.InvalidStateError('invalid state')
+        self._state = state
+        self._value = value
+        if state is not _FULFILLED:
+            # keep the original traceback, so that it does not grow each time
+            # the error is raised
+            self._traceback = value.__traceback__
+            if state is _REJECTED and self._handlers is None and \
+                    self._future is None:
+                # nothing observes this promise yet
+                self._reporter = _RejectionReporter(
+                    asyncio._get_running_loop(), value)
+        if self._future is not None:
+            self._update_future()
+        if self._handlers is not None:
+            if schedule:
+                self._schedule_dispatch()
+            else:
+                # the caller is a loop callback, so handlers can run now
+                self._dispatch()
+
+    def _add_handler(self, on_resolved, on_rejected, promise):
+        if self._handlers is None:
+            # handlers are dispatched on the loop that is running when they
+            # are registered, even if the promise settles outside of it
+            self._handlers = []
+            self._loop = asyncio._get_running_loop()
+            if self._state is not None:
+                self._clear_reporter()
+                self._schedule_dispatch()
+        self._handlers.append((on_resolved, on_rejected, promise))
+
+    def _clear_reporter(self):
+        # the rejection has been handled, so it should not be reported
+        if self._reporter is not None:
+            self._reporter.error = None
+            self._reporter = None
+
+    def _schedule_dispatch(self):
+        if self._loop is None:
+            self._loop = asyncio._get_running_loop()
+            if self._loop is None:
+                # there is no loop to run the handlers on yet
+                _deferred.append(self)
+                return
+        self._loop.call_soon(self._dispatch)
+
+    def _dispatch(self):
+        handlers, self._handlers = self._handlers, None
+        if self._state is _FULFILLED:
+            for on_resolved, _, promise in handlers:
+                Promise._handle_callback(self._value, on_resolved, promise)
+        else:
+            for _, on_rejected, promise in handlers:
+                Promise._handle_callback(self._value, on_rejected, promise,
+                                         resolve=False)
+
+    def _update_future(self):
+        if self._future.done():
+            return
+        if self._state is _FULFILLED:
+            self._future.set_result(self._value)
+        elif self._state is _REJECTED:
+            self._future.set_exception(self._value)
+        else:
+            self._future.cancel()
+
+    def _handle_future_done(self, future):
+        # cancelling the future cancels the promise
+        if future.cancelled() and self._state is None:
+            self.cancel()
 
     @staticmethod
     def _handle_callback(result, callback, promise, resolve=True):
-        if callable(callback):
+        if promise is None:
+            # internal handler with no promise to settle
+            callback(result)
+        elif callable(callback):
             try:
                 callback_result = callback(result)
                 if isinstance(callback_result, Promise):
-                    callback_result.then(lambda res: promise._resolve(res),
-                                         lambda err: promise._reject(err))
+                    callback_result._add_handler(None, None, promise)
                 else:
                     promise._resolve(callback_result)
             except BaseException as error:
@@ -266,35 +513,60 @@ class Promise:
         else:
             promise._reject(result)
 
-    @staticmethod
-    def _handle_done(on_resolved, on_rejected, promise, future):
-        try:
-            result = future.result()
-            Promise._handle_callback(result, on_resolved, promise)
-        except BaseException as error:
-            Promise._handle_callback(error, on_rejected, promise,
-                                     resolve=False)
-
     def __await__(self):
-        def _reject(error):
-            raise error
-
-        return self.catch(_reject).future.__await__()
+        if _deferred:
+            _dispatch_deferred(_get_loop())
+        if self._state is None:
+            # wait on a separate future, so that if the awaiting task is
+            # cancelled this promise is not cancelled along with it
+            waiter = _get_loop().create_future()
+
+            def _wakeup(result):
+                if not waiter.done():
+                    waiter.set_result(None)
+
+            self._add_handler(_wakeup, _wakeup, None)
+            yield from waiter
+        else:
+            # no need to wait, but yield once to allow any callbacks that are
+            # already scheduled for this promise to run first
+            self._clear_reporter()
+            yield
+        if self._state is not _FULFILLED:
+            raise self._value.with_traceback(self._traceback)
+        return self._value
 
 
 class TaskPromise(Promise):
+    __slots__ = ('task',)
+
     def __init__(self, task):
         super().__init__()
-        self.task = task
+        # the task is used as the future of the promise
+        self._future = self.task = task
+        task.add_done_callback(self._handle_task_done)
 
     def cancel(self):
-        # cancel the task associated with this future
-        # (the future will receive the cancellation error)
+        # cancel the task associated with this promise
+        # (the promise will receive the cancellation error)
         return self.task.cancel()
 
     def cancelled(self):
         return self.task.cancelled()
 
+    def _handle_task_done(self, task):
+        if task.cancelled():
+            self._settle(_CANCELLED, asyncio.CancelledError(), False)
+        elif task.exception() is not None:
+            if self._handlers is None:
+                # the exception is retrieved from the task here, so the
+                # promise has to report it if it is never handled
+                self._reporter = _RejectionReporter(
+                    asyncio._get_running_loop(), task.exception())
+            self._settle(_REJECTED, task.exception(), False)
+        else:
+            self._settle(_FULFILLED, task.result(), False)
+
 
 def promisify(func):
     """Create a promise-based async function from regular or async functions.
@@ -319,7 +591,7 @@ def promisify(func):
             result = func(*args, **kwargs)
         except BaseException as error:
             return Promise.reject(error)
-        if inspect.iscoroutine(result):
+        if iscoroutine(result):
             result = asyncio.create_task(result)
         return Promise.resolve(result)
 
@@ -329,6 +601,10 @@ def promisify(func):
 def run(func, *args, **kwargs):
     """Run an async loop until the given promise-based function returns.
 
+    A new event loop is created for the function and set as the current loop
+    while the function runs. When the function returns the loop is closed and
+    the previous current loop is restored.
+
     :param func: the promise-based function to run.
     :param args: positional arguments to pass to the function.
     :param kwargs: keyword arguments to pass to the function.
@@ -336,4 +612,29 @@ def run(func, *args, **kwargs):
     async def _run():
         return await func(*args, **kwargs)
 
-    return asyncio.get_event_loop().run_until_complete(_run())
+    previous_loop = _get_current_loop()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(_run())
+    finally:
+        asyncio.set_event_loop(previous_loop)
+        loop.close()
+
+
+def use_uvloop():
+    """Use the uvloop event loop, if it is installed.
+
+    uvloop is a fast, drop-in replacement of the asyncio event loop. After
+    this function is called, new event loops, including those created by
+    :func:`run`, are uvloop loops.
+
+    Returns ``True`` if uvloop was configured, or ``False`` if the uvloop
+    package is not installed.
+    """
+    try:
+        import uvloop
+    except ImportError:
+        return False
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
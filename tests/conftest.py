@@ -0,0 +1,12 @@
+import asyncio
+import pytest
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_asyncio_loop_factories(config, item):
+    # all the tests share a single event loop, using uvloop when available
+    try:
+        import uvloop
+    except ImportError:
+        return {'asyncio': asyncio.new_event_loop}
+    return {'uvloop': uvloop.new_event_loop}
@@ -1,331 +1,667 @@
 import asyncio
-import unittest
+import gc
+import sys
+import traceback
+import weakref
+from unittest import mock
 import pytest
 import promisio
 from promisio import Promise, promisify
-from .utils import async_test, get_fake_error
+from .utils import RESOLVED_42, get_fake_error
 
 
-class TestPromise(unittest.TestCase):
-    @async_test
-    async def test_resolved(self):
-        result = None
+async def test_resolved():
+    result = None
 
-        def f(resolve, reject):
-            resolve(42)
+    def f(resolve, reject):
+        resolve(42)
 
-        def g(x):
-            nonlocal result
-            result = x
+    def g(x):
+        nonlocal result
+        result = x
 
-        p = Promise(f)
-        p.then(g)
+    p = Promise(f)
+    await p.then(g)
+    assert result == 42
 
-        await asyncio.sleep(0)
-        while result is None:
-            await asyncio.sleep(0.05)
-        assert result == 42
 
-    @async_test
-    async def test_rejected(self):
-        result = None
-        error = get_fake_error()
+async def test_rejected():
+    result = None
+    error = get_fake_error()
 
-        def f(resolve, reject):
-            reject(error)
+    def f(resolve, reject):
+        reject(error)
 
-        def g(x):
-            nonlocal result
-            result = x
+    def g(x):
+        nonlocal result
+        result = x
 
-        p = Promise(f)
-        p.catch(g)
+    p = Promise(f)
+    await p.catch(g)
+    assert result == error
 
-        await asyncio.sleep(0)
-        while result is None:
-            await asyncio.sleep(0.05)
-        assert result == error
-
-    @async_test
-    async def test_await_resolved_promise(self):
-        p = Promise.resolve(42)
-        result = await p
-        assert result == 42
-
-    @async_test
-    async def test_await_rejected_promise(self):
-        p = Promise.reject(get_fake_error())
-        with pytest.raises(RuntimeError):
+
+async def test_await_resolved_promise():
+    p = RESOLVED_42
+    result = await p
+    assert result == 42
+
+
+async def test_await_rejected_promise():
+    p = Promise.reject(get_fake_error())
+    with pytest.raises(RuntimeError):
+        await p
+
+
+async def test_await_rejected_promise_traceback():
+    @promisify
+    def f():
+        raise get_fake_error()
+
+    p = f()
+    depths = set()
+    for i in range(10):
+        with pytest.raises(RuntimeError) as exc_info:
             await p
+        depths.add(len(traceback.extract_tb(exc_info.value.__traceback__)))
+    assert len(depths) == 1
 
-    @async_test
-    async def test_resolve_to_promise(self):
-        def f(resolve, reject):
-            resolve(42)
-
-        p = Promise(f)
-        q = Promise.resolve(p)
-        result = await q
-        assert result == 42
-
-    @async_test
-    async def test_catch(self):
-        result = None
-        result2 = None
-        error = get_fake_error()
-
-        def f(x):
-            nonlocal result
-            result = x
-            return 42
-
-        def g(x):
-            nonlocal result2
-            result2 = x
-
-        p = Promise.reject(error)
-        await p.then().then().then().catch(f).then(g)
-        assert result == error
-        assert result2 == 42
-
-    @async_test
-    async def test_then_finally(self):
-        result = None
-
-        def f():
-            nonlocal result
-            result = True
-
-        p = Promise.resolve(42)
-        await p.finally_(f)
-        assert result
-
-    @async_test
-    async def test_all(self):
-        async def f():
-            await asyncio.sleep(0.01)
-            return 'f'
 
-        async def g():
-            await asyncio.sleep(0.05)
-            return 'g'
+async def test_resolve_to_promise():
+    def f(resolve, reject):
+        resolve(42)
 
-        async def h():
-            await asyncio.sleep(0)
-            return 'h'
+    p = Promise(f)
+    q = Promise.resolve(p)
+    assert q is p
+    result = await q
+    assert result == 42
 
-        p1 = promisify(f)()
-        p2 = promisify(g)()
-        p3 = promisify(h)()
-        result = await Promise.all([p1, p2, p3])
-        assert result == ['f', 'g', 'h']
 
-    @async_test
-    async def test_empty_all(self):
-        result = await Promise.all([])
-        assert result == []
+async def test_catch():
+    result = None
+    result2 = None
+    error = get_fake_error()
 
-    @async_test
-    async def test_all_settled(self):
-        error = get_fake_error()
+    def f(x):
+        nonlocal result
+        result = x
+        return 42
 
-        async def f():
-            await asyncio.sleep(0.01)
-            return 'f'
+    def g(x):
+        nonlocal result2
+        result2 = x
 
-        async def g():
-            raise error
+    p = Promise.reject(error)
+    await p.then().then().then().catch(f).then(g)
+    assert result == error
+    assert result2 == 42
 
-        async def h():
-            await asyncio.sleep(0)
-            return 'h'
 
-        p1 = promisify(f)()
-        p2 = promisify(g)()
-        p3 = promisify(h)()
-        result = await Promise.all_settled([p1, p2, p3])
-        assert result == [
-            {'status': 'fulfilled', 'value': 'f'},
-            {'status': 'rejected', 'reason': error},
-            {'status': 'fulfilled', 'value': 'h'},
-        ]
+async def test_then_settled():
+    error = get_fake_error()
 
-    @async_test
-    async def test_any(self):
-        error = get_fake_error()
+    def f(x):
+        assert False, 'should not be called'
 
-        async def f():
-            await asyncio.sleep(0.01)
-            return 'f'
+    p = Promise.resolve(42)
+    await p
+    assert await p.then() == 42
+    assert await p.catch(f) == 42
 
-        async def g():
-            raise error
+    q = Promise.reject(error)
+    with pytest.raises(RuntimeError):
+        await q
+    with pytest.raises(RuntimeError):
+        await q.then(f)
+    assert await q.then(f, lambda x: x) == error
 
-        async def h():
-            await asyncio.sleep(0)
-            return 'h'
 
-        p1 = promisify(f)()
-        p2 = promisify(g)()
-        p3 = promisify(h)()
-        result = await Promise.any([p1, p2, p3])
-        assert result == 'h'
-        await Promise.all_settled([p1, p2, p3])
+async def test_then_after_settled():
+    result = []
 
-    @async_test
-    async def test_any_rejected(self):
-        error1 = get_fake_error(':1')
-        error2 = get_fake_error(':2')
-        error3 = get_fake_error(':3')
+    def f(x):
+        result.append(x)
 
-        async def f():
-            await asyncio.sleep(0.01)
-            raise error1
-
-        async def g():
-            await asyncio.sleep(0.05)
-            raise error2
-
-        async def h():
-            await asyncio.sleep(0)
-            raise error3
-
-        p1 = promisify(f)()
-        p2 = promisify(g)()
-        p3 = promisify(h)()
-        try:
-            await Promise.any([p1, p2, p3])
-        except promisio.AggregateError as error:
-            assert error.errors == [error1, error2, error3]
-        else:
-            assert False
-        await Promise.all_settled([p1, p2, p3])
-
-    @async_test
-    async def test_empty_any(self):
-        with pytest.raises(promisio.AggregateError):
-            await Promise.any([])
-
-    @async_test
-    async def test_race_resolved(self):
-        async def f():
-            await asyncio.sleep(0.01)
-            raise get_fake_error()
+    p = Promise()
+    p.then(f)
+    p._resolve(42)
+    await p
+    await p.then(lambda x: x + 1).then(f)
+    assert result == [42, 43]
 
-        async def g():
-            await asyncio.sleep(0.05)
-            return 'g'
 
-        async def h():
-            await asyncio.sleep(0)
-            return 'h'
+async def test_then_finally():
+    result = None
 
-        p1 = promisify(f)()
-        p2 = promisify(g)()
-        p3 = promisify(h)()
-        result = await Promise.race([p1, p2, p3])
-        assert result == 'h'
-        await Promise.all_settled([p1, p2, p3])
+    def f():
+        nonlocal result
+        result = True
 
-    @async_test
-    async def test_racei_rejected(self):
-        error = get_fake_error()
+    p = Promise.resolve(42)
+    await p.finally_(f)
+    assert result
 
-        async def f():
-            await asyncio.sleep(0.01)
-            return 'f'
 
-        async def g():
-            await asyncio.sleep(0.05)
-            return 'g'
+async def test_all():
+    f_done = asyncio.Event()
+    h_done = asyncio.Event()
 
-        async def h():
-            await asyncio.sleep(0)
-            raise error
+    async def f():
+        await h_done.wait()
+        f_done.set()
+        return 'f'
 
-        p1 = promisify(f)()
-        p2 = promisify(g)()
-        p3 = promisify(h)()
-        with pytest.raises(RuntimeError):
-            await Promise.race([p1, p2, p3])
-        await Promise.all_settled([p1, p2, p3])
-
-    @async_test
-    async def test_promisify(self):
-        error1 = get_fake_error(':1')
-        error2 = get_fake_error(':2')
-
-        def f():
-            return 'f'
-
-        async def g():
-            return 'g'
-
-        def h():
-            raise error1
-
-        async def i():
-            raise error2
-
-        p1 = promisify(f)()
-        p2 = promisify(g)()
-        p3 = promisify(h)()
-        p4 = promisify(i)()
-        result = await Promise.all_settled([p1, p2, p3, p4])
-        assert result == [
-            {'status': 'fulfilled', 'value': 'f'},
-            {'status': 'fulfilled', 'value': 'g'},
-            {'status': 'rejected', 'reason': error1},
-            {'status': 'rejected', 'reason': error2},
-        ]
-
-    @async_test
-    async def test_cancel(self):
-        @promisify
-        async def long():
-            await asyncio.sleep(10)
-
-        p = long()
-        await asyncio.sleep(0.01)
-        assert not p.cancelled()
-        assert p.cancel()
-        with pytest.raises(asyncio.CancelledError):
-            await p
-        assert p.cancelled()
+    async def g():
+        await f_done.wait()
+        return 'g'
+
+    async def h():
+        await asyncio.sleep(0)
+        h_done.set()
+        return 'h'
 
-    @async_test
-    async def test_cancel_mid_chain(self):
-        event = asyncio.Event()
-        result = None
+    p1 = promisify(f)()
+    p2 = promisify(g)()
+    p3 = promisify(h)()
+    result = await Promise.all([p1, p2, p3])
+    assert result == ['f', 'g', 'h']
 
-        @promisify
-        async def long():
-            await event.wait()
 
-        def _reject(error):
-            nonlocal result
-            result = error
+async def test_all_settled_inputs():
+    error = get_fake_error()
 
-        p = long()
-        p2 = p.then()
-        p3 = p2.catch(_reject)
-        p2.cancel()
+    async def f():
+        await asyncio.sleep(0)
+        return 'f'
+
+    p1 = promisify(f)()
+    p2 = Promise.resolve('g')
+    await p2
+    result = await Promise.all([p1, p2, 'h'])
+    assert result == ['f', 'g', 'h']
+    result = await Promise.all(p for p in (p1, p2, 'h'))
+    assert result == ['f', 'g', 'h']
+
+    p3 = Promise.reject(error)
+    with pytest.raises(RuntimeError):
         await p3
-        assert result.__class__ == asyncio.CancelledError
-        event.set()
-        await p
+    with pytest.raises(RuntimeError):
+        await Promise.all([p2, p3, 'h'])
+
+
+async def test_empty_all():
+    result = await Promise.all([])
+    assert result == []
+
+
+async def test_all_settled():
+    error = get_fake_error()
+    h_done = asyncio.Event()
+
+    async def f():
+        await h_done.wait()
+        return 'f'
+
+    async def g():
+        raise error
 
-    @async_test
-    async def test_cannot_cancel(self):
-        p = Promise.resolve(42)
-        assert not p.cancelled()
-        assert not p.cancel()
+    async def h():
+        await asyncio.sleep(0)
+        h_done.set()
+        return 'h'
+
+    p1 = promisify(f)()
+    p2 = promisify(g)()
+    p3 = promisify(h)()
+    result = await Promise.all_settled([p1, p2, p3])
+    assert result == [
+        {'status': 'fulfilled', 'value': 'f'},
+        {'status': 'rejected', 'reason': error},
+        {'status': 'fulfilled', 'value': 'h'},
+    ]
+
+
+async def test_all_settled_settled_inputs():
+    error = get_fake_error()
+
+    p1 = Promise.resolve('f')
+    await p1
+    p2 = Promise.reject(error)
+    with pytest.raises(RuntimeError):
+        await p2
+    result = await Promise.all_settled([p1, p2, 'h'])
+    assert result == [
+        {'status': 'fulfilled', 'value': 'f'},
+        {'status': 'rejected', 'reason': error},
+        {'status': 'fulfilled', 'value': 'h'},
+    ]
+
+
+async def test_empty_all_settled():
+    result = await Promise.all_settled([])
+    assert result == []
+
+
+async def test_any():
+    error = get_fake_error()
+    h_done = asyncio.Event()
+
+    async def f():
+        await h_done.wait()
+        return 'f'
+
+    async def g():
+        raise error
+
+    async def h():
+        await asyncio.sleep(0)
+        h_done.set()
+        return 'h'
+
+    p1 = promisify(f)()
+    p2 = promisify(g)()
+    p3 = promisify(h)()
+    result = await Promise.any([p1, p2, p3])
+    assert result == 'h'
+    await Promise.all_settled([p1, p2, p3])
+
+
+async def test_any_rejected():
+    error1 = get_fake_error(':1')
+    error2 = get_fake_error(':2')
+    error3 = get_fake_error(':3')
+    f_done = asyncio.Event()
+    h_done = asyncio.Event()
+
+    async def f():
+        await h_done.wait()
+        f_done.set()
+        raise error1
+
+    async def g():
+        await f_done.wait()
+        raise error2
+
+    async def h():
+        await asyncio.sleep(0)
+        h_done.set()
+        raise error3
+
+    p1 = promisify(f)()
+    p2 = promisify(g)()
+    p3 = promisify(h)()
+    try:
+        await Promise.any([p1, p2, p3])
+    except promisio.AggregateError as error:
+        assert error.errors == [error1, error2, error3]
+    else:
+        assert False
+    await Promise.all_settled([p1, p2, p3])
+
+
+async def test_any_settled_inputs():
+    error = get_fake_error()
+
+    p1 = Promise.reject(error)
+    with pytest.raises(RuntimeError):
+        await p1
+    p2 = Promise.resolve('g')
+    await p2
+    assert await Promise.any([p1, p2]) == 'g'
+    assert await Promise.any([p1, 'h']) == 'h'
+    try:
+        await Promise.any([p1, p1])
+    except promisio.AggregateError as error2:
+        assert error2.errors == [error, error]
+    else:
+        assert False
+
+
+async def test_empty_any():
+    with pytest.raises(promisio.AggregateError):
+        await Promise.any([])
+
+
+async def test_race_resolved():
+    f_done = asyncio.Event()
+    h_done = asyncio.Event()
+
+    async def f():
+        await h_done.wait()
+        f_done.set()
+        raise get_fake_error()
+
+    async def g():
+        await f_done.wait()
+        return 'g'
+
+    async def h():
+        await asyncio.sleep(0)
+        h_done.set()
+        return 'h'
+
+    p1 = promisify(f)()
+    p2 = promisify(g)()
+    p3 = promisify(h)()
+    result = await Promise.race([p1, p2, p3])
+    assert result == 'h'
+    await Promise.all_settled([p1, p2, p3])
+
+
+async def test_racei_rejected():
+    error = get_fake_error()
+    f_done = asyncio.Event()
+    h_done = asyncio.Event()
+
+    async def f():
+        await h_done.wait()
+        f_done.set()
+        return 'f'
+
+    async def g():
+        await f_done.wait()
+        return 'g'
+
+    async def h():
+        await asyncio.sleep(0)
+        h_done.set()
+        raise error
+
+    p1 = promisify(f)()
+    p2 = promisify(g)()
+    p3 = promisify(h)()
+    with pytest.raises(RuntimeError):
+        await Promise.race([p1, p2, p3])
+    await Promise.all_settled([p1, p2, p3])
+
+
+async def test_promisify():
+    error1 = get_fake_error(':1')
+    error2 = get_fake_error(':2')
+
+    def f():
+        return 'f'
+
+    async def g():
+        return 'g'
+
+    def h():
+        raise error1
+
+    async def i():
+        raise error2
+
+    p1 = promisify(f)()
+    p2 = promisify(g)()
+    p3 = promisify(h)()
+    p4 = promisify(i)()
+    result = await Promise.all_settled([p1, p2, p3, p4])
+    assert result == [
+        {'status': 'fulfilled', 'value': 'f'},
+        {'status': 'fulfilled', 'value': 'g'},
+        {'status': 'rejected', 'reason': error1},
+        {'status': 'rejected', 'reason': error2},
+    ]
+
+
+async def test_cancel():
+    @promisify
+    async def long():
+        await asyncio.Event().wait()
+
+    p = long()
+    await asyncio.sleep(0)
+    assert not p.cancelled()
+    assert p.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await p
+    assert p.cancelled()
+
+
+async def test_cancel_mid_chain():
+    event = asyncio.Event()
+    result = None
+
+    @promisify
+    async def long():
+        await event.wait()
+
+    def _reject(error):
+        nonlocal result
+        result = error
+
+    p = long()
+    p2 = p.then()
+    p3 = p2.catch(_reject)
+    p2.cancel()
+    await p3
+    assert result.__class__ == asyncio.CancelledError
+    event.set()
+    await p
+
+
+async def test_cancel_one_handler():
+    result = None
+
+    def f(x):
+        nonlocal result
+        result = x
+
+    p = Promise()
+    p2 = p.then()
+    p3 = p.then(f)
+    p2.cancel()
+    p._resolve(42)
+    await p3
+    assert p2.cancelled()
+    assert result == 42
+
+
+async def test_cancel_awaiting_task():
+    p = Promise()
+
+    async def wait():
+        return await p
+
+    task1 = asyncio.create_task(wait())
+    task2 = asyncio.create_task(wait())
+    await asyncio.sleep(0)
+    task1.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task1
+    assert not p.cancelled()
+    p._resolve(42)
+    assert await task2 == 42
+
+
+async def test_future():
+    error = get_fake_error()
+
+    p = Promise()
+    future = p.future
+    assert p.future is future
+    assert not future.done()
+    p._resolve(42)
+    assert await future == 42
+    assert await Promise.resolve(42).future == 42
+    with pytest.raises(RuntimeError):
+        await Promise.reject(error).future
+
+    p = Promise()
+    p.future.cancel()
+    with pytest.raises(asyncio.CancelledError):
         await p
-        assert not p.cancelled()
+    assert p.cancelled()
+
+    p = Promise()
+    p.cancel()
+    assert p.future.cancelled()
+
+
+async def test_unhandled_rejection():
+    error = get_fake_error()
+    task_error = get_fake_error('task')
+    contexts = []
+
+    loop = asyncio.get_running_loop()
+    handler = loop.get_exception_handler()
+    loop.set_exception_handler(lambda loop, context: contexts.append(context))
+    try:
+        Promise.reject(error)
+        p = Promise.reject(get_fake_error('awaited'))
+        with pytest.raises(RuntimeError):
+            await p
+        del p
+        await Promise.reject(get_fake_error('caught')).catch(lambda e: None)
+        await Promise.all_settled([Promise.reject(get_fake_error('all'))])
+        Promise().cancel()
 
-    def test_run(self):
         @promisify
-        def f(x):
-            return x * 2
+        async def f(error):
+            raise error
+
+        p = f(task_error)
+        await asyncio.wait([p.task])
+        del p
+        with pytest.raises(RuntimeError):
+            await f(get_fake_error('task awaited'))
+        gc.collect()
+    finally:
+        loop.set_exception_handler(handler)
+    assert len(contexts) == 2
+    assert {context['exception'] for context in contexts} == {
+        error, task_error}
+    assert contexts[0]['message'] == 'Promise rejection was never handled'
+
+
+async def test_aggregate_inputs_after_result():
+    error1 = get_fake_error('1')
+    contexts = []
+    consumed = []
+
+    def inputs(*values):
+        for value in values:
+            consumed.append(value)
+            yield value
+
+    loop = asyncio.get_running_loop()
+    handler = loop.get_exception_handler()
+    loop.set_exception_handler(lambda loop, context: contexts.append(context))
+    try:
+        with pytest.raises(RuntimeError) as exc_info:
+            await Promise.all([Promise.reject(error1),
+                               Promise.reject(get_fake_error('2'))])
+        assert exc_info.value is error1
+        assert await Promise.any(
+            ['x', Promise.reject(get_fake_error('3'))]) == 'x'
+        assert await Promise.any(inputs('a', 'b', 'c')) == 'a'
+        assert consumed == ['a', 'b', 'c']
+        gc.collect()
+    finally:
+        loop.set_exception_handler(handler)
+    assert contexts == []
+
+
+def test_unhandled_rejection_outside_loop():
+    error = get_fake_error()
+    with mock.patch.object(asyncio.log.logger, 'error') as log_error:
+        Promise.reject(error)
+        gc.collect()
+    log_error.assert_called_once_with('Promise rejection was never handled',
+                                      exc_info=error)
+
+
+async def test_cannot_cancel():
+    p = RESOLVED_42
+    assert not p.cancelled()
+    assert not p.cancel()
+    await p
+    assert not p.cancelled()
+
+
+def test_weakref():
+    p = Promise()
+    ref = weakref.ref(p)
+    assert ref() is p
+    del p
+    gc.collect()
+    assert ref() is None
+
+
+def test_run():
+    @promisify
+    def f(x):
+        return x * 2
+
+    assert promisio.run(f, 21) == 42
+
+
+def test_run_existing_promise():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        p = Promise()
+        q = p.then(lambda x: x * 2)
 
-        assert promisio.run(f, 21) == 42
+        async def f():
+            assert asyncio.get_running_loop() is not loop
+            assert asyncio.get_event_loop() is asyncio.get_running_loop()
+            p._resolve(21)
+            return await q
+
+        assert promisio.run(f) == 42
+        assert asyncio.get_event_loop() is loop
+        assert not loop.is_closed()
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+def test_run_settled_outside_loop():
+    p = Promise()
+    q = p.then(lambda x: x * 2)
+    p._resolve(21)
+    p2 = Promise()
+    q2 = p2.then(lambda x: x + 1)
+
+    async def f():
+        p2._resolve(41)
+        return await q, await q2
+
+    assert promisio.run(f) == (42, 42)
+
+
+def test_run_new_loop():
+    async def f():
+        return asyncio.get_event_loop() is asyncio.get_running_loop()
+
+    asyncio.set_event_loop(None)
+    assert promisio.run(f)
+    with pytest.raises(RuntimeError):
+        asyncio.get_event_loop()
+
+
+def test_use_uvloop():
+    uvloop = pytest.importorskip('uvloop')
+
+    async def f():
+        return asyncio.get_running_loop()
+
+    policy = asyncio.get_event_loop_policy()
+    try:
+        assert promisio.use_uvloop()
+        assert isinstance(asyncio.get_event_loop_policy(),
+                          uvloop.EventLoopPolicy)
+        loop = promisio.run(f)
+        assert type(loop) is uvloop.Loop
+        assert loop.is_closed()
+    finally:
+        asyncio.set_event_loop_policy(policy)
+
+
+def test_use_uvloop_not_installed():
+    policy = asyncio.get_event_loop_policy()
+    with mock.patch.dict(sys.modules, {'uvloop': None}):
+        assert not promisio.use_uvloop()
+    assert asyncio.get_event_loop_policy() is policy
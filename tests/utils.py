@@ -1,16 +1,23 @@
-import asyncio
 import os
-from functools import wraps
+from functools import lru_cache
+from promisio import Promise
 
 
-def async_test(f):
-    @wraps(f)
-    def wrapper(*args, **kwargs):
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(f(*args, **kwargs))
+# Settled promises never change, so tests that only await them or check
+# their state can share these instances instead of building new ones. Tests
+# that chain handlers to a promise should create their own.
+RESOLVED_42 = Promise.resolve(42)
 
-    return wrapper
+
+def mkpromise():
+    return Promise._new_pending()
+
+
+@lru_cache(maxsize=256)
+def _get_fake_error(name, suffix):
+    return RuntimeError(name + suffix)
 
 
 def get_fake_error(suffix=''):
-    return RuntimeError(os.environ.get('PYTEST_CURRENT_TEST', '') + suffix)
+    # the same error instance is returned for a given test and suffix
+    return _get_fake_error(os.environ.get('PYTEST_CURRENT_TEST', ''), suffix)